@@ -10,9 +10,28 @@ Written by Irmen de Jong (irmen@razorvine.net) - License: GNU LGPL 3.
 import os
 import cmd
 import sys
+import time
+import wave
+import hashlib
+import tempfile
+from collections import Counter
 from configparser import ConfigParser
+from synthplayer import params
 from synthplayer.sample import Sample
 from synthplayer.playback import Output
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+# translation table to turn a bar string into a mask of trigger flags (0 = no trigger, 1 = trigger)
+trigger_mask_table = bytes(0 if chr(c) in ". " else 1 for c in range(256))
+
+# how many mixed chunks can be queued ahead of the playback when streaming to the speakers.
+# The audio thread plays from this queue, so a hiccup in the mixing doesn't immediately cause an underrun.
+# The tracker display is printed while mixing, so it runs ahead of the sound by up to this many chunks (ticks).
+stream_queue_size = 2
 
 
 class Mixer:
@@ -31,39 +50,155 @@ class Mixer:
                     raise ValueError("all bars must be of equal length in the same pattern")
                 bar_length = len(bars)
         self.patterns = patterns
+        self.pattern_triggers = [self.find_triggers(p) for p in patterns]
+        self.total_ticks = sum(num_ticks for num_ticks, _ in self.pattern_triggers)
         self.instruments = instruments
         self.bpm = bpm
         self.ticks = ticks
+        self.seconds_per_tick = 60.0 / bpm / ticks
+        self.total_seconds = self.total_ticks * self.seconds_per_tick
+
+    @staticmethod
+    def find_triggers(pattern):
+        """
+        Scans the bars of a pattern for the ticks where instruments are triggered.
+        Returns a tuple (length of the pattern in ticks, sorted list of (tick, list of triggered instrument names)).
+        """
+        triggered = {}
+        num_ticks = 0
+        for instrument, bars in pattern.items():
+            num_ticks = len(bars)
+            mask = bars.encode("ascii", "replace").translate(trigger_mask_table)
+            tick = mask.find(1)
+            while tick >= 0:
+                triggered.setdefault(tick, []).append(instrument)
+                tick = mask.find(1, tick + 1)
+        return num_ticks, sorted(triggered.items())
+
+    def tick_frame(self, index, samplerate):
+        """
+        Returns the number of the sample frame where the tick with the given index starts.
+        This is calculated with integers only, so there's no floating point rounding drift on long songs.
+        """
+        return index * samplerate * 60 // (self.bpm * self.ticks)
+
+    @staticmethod
+    def frame_seconds(frame, samplerate):
+        """
+        Returns the time (in seconds) of the middle of the sample frame with the given number.
+        Sample.frame_idx converts that back to exactly this frame, where the exact start time
+        of the frame could be rounded down to the previous one.
+        """
+        return (frame + 0.5) / samplerate
 
     def mix(self, verbose=True):
         """
         Mix all the patterns into a single result sample.
+        This keeps the whole mix in memory; Song.mix_stream writes it to a file pattern by pattern instead.
         """
         if not self.patterns:
             if verbose:
                 print("No patterns to mix, output is empty.")
             return Sample()
-        total_seconds = 0.0
-        for p in self.patterns:
-            bar = next(iter(p.values()))
-            total_seconds += len(bar) * 60.0 / self.bpm / self.ticks
         if verbose:
             print("Mixing {:d} patterns...".format(len(self.patterns)))
-        mixed = Sample().make_32bit()
-        for index, timestamp, sample in self.mixed_samples(tracker=False):
-            if verbose:
-                print("\r{:3.0f} % ".format(timestamp/total_seconds*100), end="")
-            mixed.mix_at(timestamp, sample)
-        # chop/extend to get to the precise total duration (in case of silence in the last bars etc)
-        missing = total_seconds-mixed.duration
-        if missing > 0:
-            mixed.add_silence(missing)
-        elif missing < 0:
-            mixed.clip(0, total_seconds)
+        if numpy:
+            mixed = self.mix_patterns(verbose)
+        else:
+            # allocate the whole mix buffer at once, so it doesn't have to grow while mixing
+            mixed = Sample().make_32bit()
+            end = self.tick_frame(self.total_ticks, mixed.samplerate)
+            mixed.add_silence(self.frame_seconds(end, mixed.samplerate))
+            for index, timestamp, sample in self.mixed_samples(tracker=False):
+                if verbose:
+                    print("\r{:3.0f} % ".format(timestamp/self.total_seconds*100), end="")
+                mixed.mix_at(timestamp, sample)
+            if len(mixed) > end:
+                # chop off the sound that extends beyond the precise total duration
+                mixed.clip(0, self.frame_seconds(end, mixed.samplerate))
         if verbose:
             print("\rMix done.")
         return mixed
 
+    def mix_patterns(self, verbose=True):
+        """
+        Mix all the patterns into a single result sample, using numpy.
+        """
+        mixed = Sample().make_32bit()
+        # allocate the whole mix buffer at once, so it doesn't have to grow while mixing
+        buffer = numpy.zeros(mixed.nchannels * self.tick_frame(self.total_ticks, mixed.samplerate), dtype=numpy.int32)
+        position = 0
+        for chunk in self.mix_chunks():
+            if verbose:
+                print("\r{:3.0f} % ".format(position/len(buffer)*100), end="")
+            buffer[position:position+len(chunk)] = chunk
+            position += len(chunk)
+        return Sample.from_raw_frames(buffer.tobytes(), mixed.samplewidth, mixed.samplerate, mixed.nchannels)
+
+    def mix_chunks(self):
+        """
+        Generator that produces the mix as consecutive numpy int32 arrays (32 bit samples), one per pattern.
+        A distinct pattern is rendered when it first occurs, and that is then added into the mix
+        everywhere the pattern occurs again. Tick positions are rounded down to whole frames, so a rendered
+        pattern is only reused at places where that rounding is the same, to keep the result identical.
+        A rendering is dropped after the last occurrence of its pattern, so only the renderings
+        of patterns that still occur later in the song are kept in memory.
+        """
+        samplerate, nchannels = params.norm_samplerate, params.norm_nchannels
+        keys = []
+        index = 0
+        for pattern, (num_ticks, _) in zip(self.patterns, self.pattern_triggers):
+            keys.append(self.pattern_key(pattern, index, samplerate))
+            index += num_ticks
+        remaining = Counter(keys)   # how many times every rendering is still needed
+        rendered = {}
+        mix_cache = {}
+        overflow = numpy.zeros(0, dtype=numpy.int64)   # sound extending from the previous patterns into the next
+        song_end = nchannels * self.tick_frame(self.total_ticks, samplerate)
+        index = 0
+        for key, (num_ticks, pattern_triggers) in zip(keys, self.pattern_triggers):
+            # sound extending beyond the end of the song is not needed
+            start = nchannels * self.tick_frame(index, samplerate)
+            length = nchannels * self.tick_frame(index + num_ticks, samplerate) - start
+            values = rendered.get(key)
+            if values is None:
+                values = rendered[key] = self.render_pattern(index, pattern_triggers, samplerate, nchannels,
+                                                             mix_cache, song_end - start)
+            remaining[key] -= 1
+            if not remaining[key]:
+                del rendered[key]
+            values = values[:song_end - start]
+            chunk = numpy.zeros(max(length, len(values), len(overflow)), dtype=numpy.int64)
+            chunk[:len(values)] += values
+            chunk[:len(overflow)] += overflow
+            del values
+            # clip the sums to the 32 bit range, like audioop.add does
+            yield numpy.clip(chunk[:length], -2**31, 2**31-1).astype(numpy.int32)
+            overflow = chunk[length:]
+            index += num_ticks
+
+    def pattern_key(self, pattern, index, samplerate):
+        """The key under which the rendering of the pattern that starts at the given tick index, is stored."""
+        return tuple(pattern.items()), index * samplerate * 60 % (self.bpm * self.ticks)
+
+    def render_pattern(self, index, pattern_triggers, samplerate, nchannels, mix_cache, max_length):
+        """
+        Mixes the triggers of a single pattern, that starts at the given tick index, into a numpy int64 array.
+        The array includes the sound that extends beyond the end of the pattern, up to max_length values.
+        The values are summed in 64 bits so they can't overflow; they're clipped to 32 bits after mixing.
+        """
+        pattern_start = self.tick_frame(index, samplerate)
+        placed = []
+        for tick, instruments in pattern_triggers:
+            sample = self.triggered_sample([(instrument, self.instruments[instrument]) for instrument in instruments], mix_cache)
+            offset = nchannels * (self.tick_frame(index + tick, samplerate) - pattern_start)
+            values = numpy.frombuffer(sample.view_frame_data(), dtype=numpy.int32)   # the sample is locked, so this is safe
+            placed.append((offset, values[:max_length - offset]))
+        rendered = numpy.zeros(max((offset + len(values) for offset, values in placed), default=0), dtype=numpy.int64)
+        for offset, values in placed:
+            rendered[offset:offset+len(values)] += values
+        return rendered
+
     def mix_generator(self):
         """
         Returns a generator that produces samples that are the chronological
@@ -73,66 +208,63 @@ class Mixer:
         if not self.patterns:
             yield Sample()
             return
-        total_seconds = 0.0
-        for p in self.patterns:
-            bar = next(iter(p.values()))
-            total_seconds += len(bar) * 60.0 / self.bpm / self.ticks
-        mixed_duration = 0.0
+        samplerate = params.norm_samplerate
         samples = self.mixed_samples()
         # get the first sample
-        index, previous_timestamp, sample = next(samples)
+        index, timestamp, sample = next(samples)
         mixed = Sample().make_32bit()
-        mixed.mix_at(previous_timestamp, sample)
+        mixed.mix_at(timestamp, sample)
+        position = 0    # the frame where the current chunk starts
         # continue mixing the following samples
         for index, timestamp, sample in samples:
-            trigger_duration = timestamp-previous_timestamp
+            trigger_frames = self.tick_frame(index, samplerate) - position
             overflow = None
-            if mixed.duration < trigger_duration:
+            if len(mixed) < trigger_frames:
                 # fill with some silence to reach the next sample position
-                mixed.add_silence(trigger_duration - mixed.duration)
-            elif mixed.duration > trigger_duration:
+                mixed.add_silence(self.frame_seconds(trigger_frames - len(mixed), samplerate))
+            elif len(mixed) > trigger_frames:
                 # chop off the sound that extends into the next sample position
                 # keep this overflow and mix it later!
-                overflow = mixed.split(trigger_duration)
-            mixed_duration += mixed.duration
+                overflow = mixed.split(self.frame_seconds(trigger_frames, samplerate))
             yield mixed
             mixed = overflow if overflow else Sample().make_32bit()
             mixed.mix(sample)
-            previous_timestamp = timestamp
+            position += trigger_frames
         # output the last remaining sample and extend it to the end of the duration if needed
-        timestamp = total_seconds
-        trigger_duration = timestamp-previous_timestamp
-        if mixed.duration < trigger_duration:
-            mixed.add_silence(trigger_duration - mixed.duration)
-        elif mixed.duration > trigger_duration:
-            mixed.clip(0, trigger_duration)
-        mixed_duration += mixed.duration
+        trigger_frames = self.tick_frame(self.total_ticks, samplerate) - position
+        if len(mixed) < trigger_frames:
+            mixed.add_silence(self.frame_seconds(trigger_frames - len(mixed), samplerate))
+        elif len(mixed) > trigger_frames:
+            mixed.clip(0, self.frame_seconds(trigger_frames, samplerate))
         yield mixed
 
     def mixed_triggers(self, tracker):
         """
         Generator for all triggers in chronological sequence.
         Every element is a tuple: (trigger index, time offset (seconds), list of (instrumentname, sample tuples)
+        The time offset points into the sample frame where the tick starts (see tick_frame and frame_seconds).
         """
-        time_per_index = 60.0 / self.bpm / self.ticks
+        samplerate = params.norm_samplerate
+        if tracker:
+            positions = {instrument: i for i, instrument in enumerate(self.instruments)}
+            nodots = ["."] * len(positions)
+            next_flush = 0.0
         index = 0
-        for pattern_nr, pattern in enumerate(self.patterns, start=1):
-            pattern = list(pattern.items())
-            num_triggers = len(pattern[0][1])
-            for i in range(num_triggers):
-                triggers = []
-                triggered_instruments = set()
-                for instrument, bars in pattern:
-                    if bars[i] not in ". ":
-                        sample = self.instruments[instrument]
-                        triggers.append((instrument, sample))
-                        triggered_instruments.add(instrument)
-                if triggers:
-                    if tracker:
-                        triggerdots = ['#' if instr in triggered_instruments else '.' for instr in self.instruments]
-                        print("\r{:3d} [{:3d}] ".format(index, pattern_nr), "".join(triggerdots), end="   ", flush=True)
-                    yield index, time_per_index*index, triggers
-                index += 1
+        for pattern_nr, (num_ticks, pattern_triggers) in enumerate(self.pattern_triggers, start=1):
+            for tick, instruments in pattern_triggers:
+                triggers = [(instrument, self.instruments[instrument]) for instrument in instruments]
+                if tracker:
+                    triggerdots = nodots.copy()
+                    for instrument in instruments:
+                        triggerdots[positions[instrument]] = "#"
+                    print("\r{:3d} [{:3d}] ".format(index + tick, pattern_nr), "".join(triggerdots), end="   ")
+                    now = time.monotonic()
+                    if now >= next_flush:
+                        # the display can't be followed faster than this anyway
+                        sys.stdout.flush()
+                        next_flush = now + 0.05
+                yield index + tick, self.frame_seconds(self.tick_frame(index + tick, samplerate), samplerate), triggers
+            index += num_ticks
 
     def mixed_samples(self, tracker=True):
         """
@@ -141,32 +273,46 @@ class Mixer:
         """
         mix_cache = {}  # we cache stuff to avoid repeated mixes of the same instruments
         for index, timestamp, triggers in self.mixed_triggers(tracker):
-            if len(triggers) > 1:
-                # sort the samples to have the longest one as the first
-                # this allows us to allocate the target mix buffer efficiently
-                triggers = sorted(triggers, key=lambda t: t[1].duration, reverse=True)
-                instruments_key = tuple(instrument for instrument, _ in triggers)
-                if instruments_key in mix_cache:
-                    yield index, timestamp, mix_cache[instruments_key]
-                    continue
-                # duplicate the longest sample as target mix buffer, then mix the remaining samples into it
-                mixed = triggers[0][1].copy()
-                for _, sample in triggers[1:]:
-                    mixed.mix(sample)
-                mixed.lock()
-                mix_cache[instruments_key] = mixed   # cache the mixed instruments sample
-                yield index, timestamp, mixed
-            else:
-                # simply yield the unmixed sample from the single trigger
-                yield index, timestamp, triggers[0][1]
+            yield index, timestamp, self.triggered_sample(triggers, mix_cache)
+
+    def triggered_sample(self, triggers, mix_cache):
+        """
+        Returns the sample to play for the given triggers (list of (instrumentname, sample) tuples).
+        That's the sample itself for a single trigger, or the mix of all of them (which is cached in mix_cache).
+        """
+        if len(triggers) > 1:
+            instruments = frozenset(instrument for instrument, _ in triggers)
+            # the order in which the instruments are triggered doesn't matter for the mix
+            if instruments not in mix_cache:
+                mix_cache[instruments] = self.premix(instruments)   # cache the mixed instruments sample
+            return mix_cache[instruments]
+        # simply use the unmixed sample from the single trigger
+        return triggers[0][1]
+
+    def premix(self, instruments):
+        """Mixes the samples of the given instruments together, into a new locked sample."""
+        # duplicate the longest sample as target mix buffer, then mix the remaining samples into it
+        # (the instruments are sorted by name first, so that the mixing order is always the same)
+        samples = sorted((self.instruments[instrument] for instrument in sorted(instruments)), key=lambda s: s.duration, reverse=True)
+        mixed = samples[0].copy()
+        for sample in samples[1:]:
+            mixed.mix(sample)
+        return mixed.lock()
 
 
 class Song:
     """
     Represents a set of instruments, patterns and bars that make up a 'song'.
     """
+    large_sample_size = 4 * 1024 * 1024     # sample files larger than this are resampled while reading
+    read_chunk_size = 64 * 1024             # bytes per chunk when reading and resampling large sample files
+    # set this to a directory (command line option -c) to cache the normalized samples in,
+    # to skip the conversion when the song is loaded again
+    sample_cache_dir = None
+
     def __init__(self):
         self.instruments = {}
+        self.sample_files = {}
         self.sample_path = None
         self.bpm = 128
         self.ticks = 4
@@ -175,11 +321,10 @@ class Song:
 
     def read(self, song_file, discard_unused_instruments=True):
         """Read a song from a saved file."""
-        with open(song_file):
-            pass    # test for file existence
-        print("Loading song...")
-        cp = ConfigParser()
-        cp.read(song_file)
+        cp = ConfigParser(interpolation=None)     # no %-interpolation needed for paths and bars
+        with open(song_file) as f:
+            print("Loading song...")
+            cp.read_file(f)
         self.sample_path = cp["paths"]["samples"]
         self.read_samples(cp["samples"], self.sample_path)
         if "song" in cp:
@@ -187,9 +332,8 @@ class Song:
             self.ticks = cp["song"].getint("ticks")
             self.read_patterns(cp, cp["song"]["patterns"].split())
         print("Done; {:d} instruments and {:d} patterns.".format(len(self.instruments), len(self.patterns)))
-        unused_instruments = self.instruments.keys()
-        for pattern_name in self.pattern_sequence:
-            unused_instruments -= self.patterns[pattern_name].keys()
+        used_instruments = set().union(*(self.patterns[name].keys() for name in self.pattern_sequence))
+        unused_instruments = self.instruments.keys() - used_instruments
         if unused_instruments and discard_unused_instruments:
             for instrument in list(unused_instruments):
                 del self.instruments[instrument]
@@ -200,14 +344,81 @@ class Song:
     def read_samples(self, instruments, samples_path):
         """Reads the sample files for the instruments."""
         self.instruments = {}
-        for name, file in sorted(instruments.items()):
-            self.instruments[name] = Sample(wave_file=os.path.join(samples_path, file)).normalize().make_32bit(scale_amplitude=False).lock()
+        self.sample_files = dict(sorted(instruments.items()))
+        # Every distinct file is read only once; instruments using the same file share its (locked) sample.
+        loaded = {}
+        for file in self.sample_files.values():
+            if file not in loaded:
+                loaded[file] = self.read_normalized_sample(os.path.join(samples_path, file)).lock()
+        for name, file in self.sample_files.items():
+            self.instruments[name] = loaded[file]
+
+    def read_normalized_sample(self, filename):
+        """
+        Reads a sample file and converts it to the form used for mixing: normalized, with 32 bit sample width.
+        If sample_cache_dir is set, the converted sample data is cached there, so next time it can be read
+        directly without conversion. A changed sample file (other size or modification time) gets a new cache entry.
+        """
+        cache_file = None
+        if self.sample_cache_dir:
+            st = os.stat(filename)
+            key = "{:s}-{:d}-{:d}-{:d}-{:d}-{:d}".format(os.path.abspath(filename), st.st_size, st.st_mtime_ns,
+                                                         params.norm_samplerate, params.norm_samplewidth, params.norm_nchannels)
+            cache_file = os.path.join(self.sample_cache_dir, hashlib.sha1(key.encode()).hexdigest() + ".raw")
+            if os.path.isfile(cache_file):
+                with wave.open(filename) as w:
+                    expected_frames = w.getnframes() * params.norm_samplerate / w.getframerate()
+                with open(cache_file, "rb") as f:
+                    frames = f.read()
+                frame_size = 4 * params.norm_nchannels
+                # resampling may round the length by a frame; anything else is a damaged entry that is converted again
+                if len(frames) % frame_size == 0 and abs(len(frames) // frame_size - expected_frames) <= 2:
+                    return Sample.from_raw_frames(frames, 4, params.norm_samplerate, params.norm_nchannels)
+        sample = self.read_sample(filename).normalize().make_32bit(scale_amplitude=False)
+        if cache_file:
+            tmp_file = None
+            try:
+                os.makedirs(self.sample_cache_dir, exist_ok=True)
+                fd, tmp_file = tempfile.mkstemp(suffix=".tmp", dir=self.sample_cache_dir)
+                with open(fd, "wb") as f:
+                    sample.write_frames(f)
+                os.replace(tmp_file, cache_file)
+            except OSError:
+                # caching is optional
+                if tmp_file and os.path.exists(tmp_file):
+                    os.remove(tmp_file)
+        return sample
+
+    def read_sample(self, filename):
+        """
+        Reads a single sample file. Large files are resampled chunk by chunk while they're
+        being read, so that the original and the resampled data don't both have to be in memory.
+        """
+        with wave.open(filename) as w:
+            nchannels, samplewidth, samplerate = w.getnchannels(), w.getsampwidth(), w.getframerate()
+            size = w.getnframes() * nchannels * samplewidth
+            if size <= self.large_sample_size or samplerate == params.norm_samplerate:
+                return Sample(wave_file=filename)
+            header = Sample.from_raw_frames(b"", samplewidth, samplerate, nchannels)
+            chunk_frames = self.read_chunk_size // nchannels // samplewidth
+            frames = bytearray()
+            state = None
+            while True:
+                chunk = w.readframes(chunk_frames)
+                if not chunk:
+                    break
+                converted, state = header.ratecv_stream(chunk, params.norm_samplerate, state)
+                frames.extend(converted)
+        return Sample.from_raw_frames(frames, samplewidth, params.norm_samplerate, nchannels)
 
     def read_patterns(self, songdef, names):
         """Reads and parses the pattern specs from the song."""
         self.pattern_sequence = []
         self.patterns = {}
         for name in names:
+            if name in self.patterns:
+                self.pattern_sequence.append(name)      # already parsed (the pattern occurs more than once in the song)
+                continue
             if "pattern."+name not in songdef:
                 raise ValueError("pattern definition not found: "+name)
             bar_length = 0
@@ -215,7 +426,7 @@ class Song:
             for instrument, bars in songdef["pattern."+name].items():
                 if instrument not in self.instruments:
                     raise ValueError("instrument '{instr:s}' not defined (pattern: {pattern:s})".format(instr=instrument, pattern=name))
-                bars = bars.replace(' ', '')
+                bars = sys.intern(bars.replace(' ', ''))   # identical bars share a single string
                 if len(bars) % self.ticks != 0:
                     raise ValueError("all patterns must be multiple of song ticks (pattern: {pattern:s}.{instr:s})"
                                      .format(pattern=name, instr=instrument))
@@ -229,12 +440,12 @@ class Song:
     def write(self, output_filename):
         """Save the song definitions to an output file."""
         import collections
-        cp = ConfigParser(dict_type=collections.OrderedDict)
+        cp = ConfigParser(dict_type=collections.OrderedDict, interpolation=None)
         cp["paths"] = {"samples": self.sample_path}
         cp["song"] = {"bpm": self.bpm, "ticks": self.ticks, "patterns": " ".join(self.pattern_sequence)}
         cp["samples"] = {}
-        for name, sample in sorted(self.instruments.items()):
-            cp["samples"][name] = os.path.basename(sample.filename)
+        for name in sorted(self.instruments):
+            cp["samples"][name] = self.sample_files[name]
         for name, pattern in sorted(self.patterns.items()):
             # Note: the layout of the patterns is not optimized for human viewing. You may want to edit it afterwards.
             cp["pattern."+name] = collections.OrderedDict(sorted(pattern.items()))
@@ -242,18 +453,45 @@ class Song:
             cp.write(f)
         print("Saved to '{:s}'.".format(output_filename))
 
-    def mix(self, output_filename):
-        """Mix the song into a resulting mix sample."""
+    def mix(self, output_filename=None):
+        """Mix the song into a resulting (16 bit) mix sample, and write it to a wav file if a filename is given."""
         if not self.pattern_sequence:
             raise ValueError("There's nothing to be mixed; no song loaded or song has no patterns.")
         patterns = [self.patterns[name] for name in self.pattern_sequence]
         mixer = Mixer(patterns, self.bpm, self.ticks, self.instruments)
         result = mixer.mix()
         result.make_16bit()
-        result.write_wav(output_filename)
-        print("Output is {:.2f} seconds, written to: {:s}".format(result.duration, output_filename))
+        if output_filename:
+            result.write_wav(output_filename)
+            print("Output is {:.2f} seconds, written to: {:s}".format(result.duration, output_filename))
         return result
 
+    def mix_stream(self, output_filename):
+        """
+        Mix the song and write it to a wav file pattern by pattern, so the whole mix doesn't have to be in memory.
+        The song is mixed twice: once to find its peak amplitude for the conversion to 16 bits, and once to write it.
+        The patterns are rendered again for the second run, rather than keeping all renderings around.
+        Without numpy, this simply mixes the whole song in memory first.
+        """
+        if not numpy:
+            return self.mix(output_filename)
+        if not self.pattern_sequence:
+            raise ValueError("There's nothing to be mixed; no song loaded or song has no patterns.")
+        patterns = [self.patterns[name] for name in self.pattern_sequence]
+        mixer = Mixer(patterns, self.bpm, self.ticks, self.instruments)
+        max_amp = max(max(int(chunk.max(initial=0)), -int(chunk.min(initial=0))) for chunk in mixer.mix_chunks())
+        duration = 0.0
+        with Sample.wave_write_begin(output_filename, Sample()) as out:
+            for chunk in mixer.mix_chunks():
+                sample = Sample.from_raw_frames(chunk.tobytes(), 4, params.norm_samplerate, params.norm_nchannels)
+                if max_amp > 0:
+                    # the same amplification that make_16bit() would do on the whole mix
+                    sample.amplify((2**31-2)/max_amp)
+                Sample.wave_write_append(out, sample.make_16bit(False))
+                duration += sample.duration
+            Sample.wave_write_end(out)
+        print("Output is {:.2f} seconds, written to: {:s}".format(duration, output_filename))
+
     def mixed_triggers(self):
         """
         Generator that produces all the instrument triggers needed to mix/stream the song.
@@ -282,7 +520,7 @@ class Repl(cmd.Cmd):
     def __init__(self, discard_unused_instruments=False):
         self.song = Song()
         self.discard_unused_instruments = discard_unused_instruments
-        self.out = Output(mixing="sequential", queue_size=1)
+        self.out = Output(mixing="sequential", queue_size=stream_queue_size)
         super(Repl, self).__init__()
 
     def do_quit(self, args):
@@ -375,12 +613,9 @@ class Repl(cmd.Cmd):
         if not self.song.pattern_sequence:
             print("Nothing to be mixed.")
             return
-        output = "__temp_mix.wav"
-        self.song.mix(output)
-        mix = Sample(wave_file=output)
+        mix = self.song.mix()
         print("Playing sound...")
         self.out.play_sample(mix)
-        os.remove(output)
 
     def do_stream(self, args):
         """
@@ -406,6 +641,7 @@ class Repl(cmd.Cmd):
             print("\r                          ")
             self.out.wait_all_played()
         except KeyboardInterrupt:
+            self.out.silence()
             print("Stopped.")
 
     def do_rec(self, args):
@@ -427,7 +663,7 @@ If a pattern with the name doesn't exist yet it will be added."""
             self.song.patterns[pattern_name] = {}
         pattern = self.song.patterns[pattern_name]
         if bars:
-            bars = bars.replace(' ', '')
+            bars = sys.intern(bars.replace(' ', ''))
             if len(bars) % self.song.ticks != 0:
                 print("Bar length must be multiple of the number of ticks.")
                 return
@@ -488,7 +724,7 @@ def main(track_file, outputfile=None, interactive=False):
     else:
         song = Song()
         song.read(track_file, discard_unused_instruments=discard_unused)
-        with Output(mixing="sequential", queue_size=1) as out:
+        with Output(mixing="sequential", queue_size=stream_queue_size) as out:
             if out.supports_streaming:
                 # mix and stream output in real time
                 print("Mixing and streaming to speakers...")
@@ -500,7 +736,7 @@ def main(track_file, outputfile=None, interactive=False):
             else:
                 # output can't stream, fallback on mixing everything to a wav
                 print("(Sorry, streaming audio is not possible, install one of the audio libraries that supports that)")
-                song.mix(outputfile)
+                song.mix_stream(outputfile)
                 mix = Sample(wave_file=outputfile)
                 print("Playing sound...")
                 out.play_sample(mix)
@@ -508,26 +744,33 @@ def main(track_file, outputfile=None, interactive=False):
 
 
 def usage():
-    print("Arguments:  [-i] trackfile.ini")
+    print("Arguments:  [-c cachedir] [-i] trackfile.ini")
+    print("   -c = cache the converted samples in this directory, to load the song faster next time")
     print("   -i = start interactive editing mode")
     raise SystemExit(1)
 
 
 if __name__ == "__main__":
-    if len(sys.argv) not in (2, 3):
+    args = sys.argv[1:]
+    if args and args[0] == "-c":
+        if len(args) < 2:
+            usage()
+        Song.sample_cache_dir = args[1]
+        args = args[2:]
+    if len(args) not in (1, 2):
         usage()
     track_file = None
     interactive = False
-    if len(sys.argv) == 2:
-        if sys.argv[1] == "-i":
+    if len(args) == 1:
+        if args[0] == "-i":
             usage()  # need a trackfile as well to at least initialize the samples
         else:
-            track_file = sys.argv[1]
-    elif len(sys.argv) == 3:
-        if sys.argv[1] != "-i":
+            track_file = args[0]
+    elif len(args) == 2:
+        if args[0] != "-i":
             usage()
         interactive = True
-        track_file = sys.argv[2]
+        track_file = args[1]
     if interactive:
         main(track_file, interactive=True)
     else:
@@ -26,6 +26,8 @@ default_audio_device = -1
 
 class Output:
     """Plays samples to audio output device or streams them to a file."""
+    file_write_buffer_size = 64*1024    # stream_to_file collects this many bytes before writing them out
+
     def __init__(self, samplerate: int = 0, samplewidth: int = 0, nchannels: int = 0,
                  frames_per_chunk: int = 0, mixing: str = "mix", queue_size: int = 100) -> None:
         self.samplerate = self.samplewidth = self.nchannels = 0
@@ -111,8 +113,23 @@ class Output:
         samples = self.normalized_samples(samples, 26000)
         sample = next(samples)
         with Sample.wave_write_begin(filename, sample) as out:
+            # the samples are often very short, so write them out in larger batches
+            buffer = bytearray()
             for sample in samples:
-                Sample.wave_write_append(out, sample)
+                try:
+                    buffer += sample.view_frame_data()
+                except NotImplementedError:
+                    # a streaming sample has no frame buffer to view, write it out directly
+                    if buffer:
+                        out.writeframesraw(buffer)
+                        buffer.clear()
+                    Sample.wave_write_append(out, sample)
+                    continue
+                if len(buffer) >= self.file_write_buffer_size:
+                    out.writeframesraw(buffer)
+                    buffer.clear()
+            if buffer:
+                out.writeframesraw(buffer)
             Sample.wave_write_end(out)
 
     def silence(self) -> None:
@@ -5,13 +5,17 @@ No actual audio library dependent playback code is present in this module.
 Written by Irmen de Jong (irmen@razorvine.net) - License: GNU LGPL 3.
 """
 
+import os
 import sys
+import stat
 import wave
+import mmap
+import struct
 import audioop
 import array
 import math
 import itertools
-from typing import Callable, Generator, Iterable, Any, Tuple, Union, Optional, BinaryIO, Sequence, Iterator
+from typing import Callable, Generator, Iterable, Any, Tuple, Union, Optional, BinaryIO, Sequence, Iterator, Dict, Type
 from . import params
 from .oscillators import Oscillator
 try:
@@ -33,18 +37,108 @@ samplewidths_to_arraycode = {
 if array.array('i').itemsize == 4:
     samplewidths_to_arraycode[4] = 'i'
 
+if numpy:
+    samplewidths_to_numpytype = {
+        1: numpy.int8,
+        2: numpy.int16,
+        4: numpy.int32
+    }   # type: Dict[int, Type[numpy.signedinteger]]
+else:
+    samplewidths_to_numpytype = {}
+
+
+def _mul(frames: bytes, samplewidth: int, factor: float, clip: bool = True) -> bytes:
+    """
+    Multiplies all sample values by the given factor, clipping them to the sample width's range.
+    This gives identical results to audioop.mul, but is a lot faster if numpy is available.
+    Clipping can be skipped if the caller knows the results stay within range.
+    """
+    if numpy is None or samplewidth == 3:
+        return audioop.mul(frames, samplewidth, factor)    # type: ignore
+    datatype = samplewidths_to_numpytype[samplewidth]
+    values = numpy.frombuffer(frames, dtype=datatype) * float(factor)
+    if clip:
+        info = numpy.iinfo(datatype)
+        numpy.clip(values, info.min, info.max, out=values)
+    numpy.floor(values, out=values)
+    return values.astype(datatype).tobytes()
+
+
+def _max(frames: bytes, samplewidth: int) -> int:
+    """
+    Returns the maximum absolute sample value.
+    This gives identical results to audioop.max, but is faster if numpy is available.
+    """
+    if numpy is None or samplewidth == 3 or not frames:
+        return audioop.max(frames, samplewidth)     # type: ignore
+    values = numpy.frombuffer(frames, dtype=samplewidths_to_numpytype[samplewidth])
+    return max(int(values.max()), -int(values.min()))
+
+
+def _ramp(frames: bytes, samplewidth: int, factors: 'numpy.ndarray') -> bytes:
+    """
+    Multiplies the sample values by the corresponding factors (truncating them, like int() does), using numpy.
+    Used for the volume ramps of the fades, and for amplitude modulation.
+    """
+    if samplewidth not in samplewidths_to_numpytype:
+        # same error as the array based code gives, for 24 bit samples
+        raise ValueError("can't create a Python array for samplewidth " + str(samplewidth))
+    datatype = samplewidths_to_numpytype[samplewidth]
+    info = numpy.iinfo(datatype)
+    values = numpy.frombuffer(frames, dtype=datatype) * factors
+    numpy.clip(values, info.min, info.max, out=values)
+    return values.astype(datatype).tobytes()
+
+
+def _wav_pcm_layout(data: Union[bytes, mmap.mmap]) -> Optional[Tuple[int, int, int, int, int]]:
+    """
+    Locates the sample data in the raw contents of a plain PCM wav file by walking its RIFF chunks.
+    Returns (nchannels, samplerate, samplewidth, data offset, data length) or None if it's not a file we understand.
+    """
+    if len(data) < 12 or data[0:4] != b"RIFF" or data[8:12] != b"WAVE":
+        return None
+    fmt = None
+    offset = 12
+    while offset + 8 <= len(data):
+        chunk_id = data[offset:offset+4]
+        chunk_size = struct.unpack_from("<I", data, offset+4)[0]
+        offset += 8
+        if chunk_id == b"fmt ":
+            if chunk_size < 16:
+                return None
+            fmt = struct.unpack_from("<HHIIHH", data, offset)
+        elif chunk_id == b"data":
+            if fmt is None or fmt[0] != 1:
+                return None     # no format info, or not plain PCM
+            _, nchannels, samplerate, _, _, bits = fmt
+            framesize = nchannels * ((bits + 7) // 8)
+            if framesize == 0:
+                return None
+            length = min(chunk_size, len(data) - offset) // framesize * framesize
+            return nchannels, samplerate, (bits + 7) // 8, offset, length
+        offset += chunk_size + (chunk_size & 1)
+    return None
+
 
 class Sample:
     """
     Audio sample data. Supports integer sample formats of 2, 3 and 4 bytes per sample (no floating-point).
     Most operations modify the sample data in place (if it's not locked) and return the sample object,
     so you can easily chain several operations.
+    Sample uses __slots__ to keep the many small sample objects lean, so you can't add attributes of
+    your own to a Sample instance (weak references do work). Make a subclass if you need extra attributes.
     """
+    __slots__ = ("name", "__locked", "__shared", "__frames", "__samplewidth", "__samplerate", "__nchannels", "__filename",
+                 "__weakref__")
+
     def __init__(self, wave_file: Optional[Union[str, BinaryIO]] = None, name: str = "",
                  samplerate: int = 0, nchannels: int = 0, samplewidth: int = 0) -> None:
         """Creates a new empty sample, or loads it from a wav file."""
         self.name = name
         self.__locked = False
+        # is the (bytearray) sample data shared with a copy, the caller or a handed out view?
+        # If so, it is copied first before it is changed in place.
+        self.__shared = False
         self.__samplerate = self.__nchannels = self.__samplewidth = 0
         if params.norm_nchannels not in (1, 2):
             raise ValueError("norm_nchannels has invalid value, can only be 1 or 2")
@@ -89,6 +183,8 @@ class Sample:
             s.__frames = bytes(frames)
         else:
             s.__frames = frames
+            # a bytearray still belongs to the caller, so it is copied before it's modified in place
+            s.__shared = isinstance(frames, bytearray)
         s.__samplerate = int(samplerate)
         s.__samplewidth = int(samplewidth)
         s.__nchannels = int(numchannels)
@@ -104,9 +200,12 @@ class Sample:
             except OverflowError:
                 array_or_list = cls.get_array(4, array_or_list)
         elif numpy:
-            if isinstance(array_or_list, numpy.ndarray) and any(array_or_list):
-                if not isinstance(array_or_list[0], (int, numpy.integer)):
-                    raise TypeError("the sample values must be integer")
+            # check the array's type rather than going through all of its values
+            if isinstance(array_or_list, numpy.ndarray) and array_or_list.dtype.kind not in "iu" and array_or_list.any():
+                raise TypeError("the sample values must be integer")
+        elif isinstance(array_or_list, array.array):
+            if array_or_list.typecode in "fd" and any(array_or_list):
+                raise TypeError("the sample values must be integer")
         else:
             if any(array_or_list):
                 if type(array_or_list[0]) is not int:
@@ -174,7 +273,7 @@ class Sample:
 
     @property
     def maximum(self) -> int:
-        return audioop.max(self.__frames, self.samplewidth)     # type: ignore
+        return _max(self.__frames, self.samplewidth)
 
     @property
     def rms(self) -> float:
@@ -219,8 +318,17 @@ class Sample:
         return len(self.__frames) // self.__samplewidth // self.__nchannels
 
     def view_frame_data(self) -> memoryview:
-        """return a memoryview on the raw frame data."""
-        return memoryview(self.__frames)
+        """return a (read-only) memoryview on the raw frame data."""
+        return self.__export_frames()
+
+    def __export_frames(self) -> memoryview:
+        # The view must keep showing the current data, so the next in-place operation has to copy it first.
+        if not isinstance(self.__frames, bytearray):
+            return memoryview(self.__frames)
+        self.__shared = True
+        if sys.version_info < (3, 8):
+            return memoryview(bytes(self.__frames))     # no read-only views on a bytearray before Python 3.8
+        return memoryview(self.__frames).toreadonly()
 
     def chunked_frame_data(self, chunksize: int, repeat: bool = False,
                            stopcondition: Callable[[], bool] = lambda: False) -> Generator[memoryview, None, None]:
@@ -236,7 +344,7 @@ class Sample:
             if len(bdata) < chunksize:
                 bdata = bdata * int(math.ceil(chunksize / len(bdata)))
             length = len(bdata)
-            bdata += bdata[:chunksize]
+            bdata = bdata + bdata[:chunksize]
             mdata = memoryview(bdata)
             i = 0
             while not stopcondition():
@@ -244,7 +352,7 @@ class Sample:
                 i = (i + chunksize) % length
         else:
             # one-shot
-            mdata = memoryview(self.__frames)
+            mdata = self.__export_frames()
             i = 0
             while i < len(mdata) and not stopcondition():
                 yield mdata[i: i + chunksize]
@@ -259,11 +367,7 @@ class Sample:
          (if numpy is available)"""
         if numpy:
             maxsize = 2**(8*self.__samplewidth-1)
-            datatype = {
-                1: numpy.int8,
-                2: numpy.int16,
-                4: numpy.int32
-            }[self.samplewidth]
+            datatype = samplewidths_to_numpytype[self.samplewidth]
             na = numpy.frombuffer(self.__frames, dtype=datatype).reshape((-1, self.nchannels))
             return na.astype(numpy.float32) / float(maxsize)
         else:
@@ -279,7 +383,12 @@ class Sample:
 
     def copy(self) -> 'Sample':
         """Returns a copy of the sample (unlocked)."""
-        cpy = self.__class__()
+        if self.__class__ is Sample:
+            # no need to run __init__, everything is copied over
+            cpy = Sample.__new__(Sample)
+            cpy.__locked = False
+        else:
+            cpy = self.__class__()    # subclasses may have their own attributes to initialize
         cpy.copy_from(self)
         return cpy
 
@@ -287,7 +396,12 @@ class Sample:
         """Overwrite the current sample with a copy of the other."""
         if self.__locked:
             raise RuntimeError("cannot modify a locked sample")
+        # the sample data is shared instead of copied. A (mutable) bytearray is copied
+        # only when one of the samples is about to modify it in place (copy on write).
         self.__frames = other.__frames
+        self.__shared = isinstance(other.__frames, bytearray)
+        if self.__shared:
+            other.__shared = True
         self.__samplewidth = other.__samplewidth
         self.__samplerate = other.__samplerate
         self.__nchannels = other.__nchannels
@@ -302,12 +416,14 @@ class Sample:
 
     def frame_idx(self, seconds: float) -> int:
         """Calculate the raw frame bytes index for the sample at the given timestamp."""
-        return self.nchannels*self.samplewidth*int(self.samplerate*seconds)
+        return self.__nchannels*self.__samplewidth*int(self.__samplerate*seconds)
 
     def load_wav(self, file_or_stream: Union[str, BinaryIO]) -> 'Sample':
         """Loads sample data from the wav file. You can use a filename or a stream object."""
         if self.__locked:
             raise RuntimeError("cannot modify a locked sample")
+        if isinstance(file_or_stream, str) and self.__load_wav_mmap(file_or_stream):
+            return self
         with wave.open(file_or_stream) as w:
             if not 2 <= w.getsampwidth() <= 4:
                 raise IOError("only supports sample sizes of 2, 3 or 4 bytes")
@@ -330,6 +446,40 @@ class Sample:
                 self.__frames = w.readframes(nframes)
             return self
 
+    def __load_wav_mmap(self, filename: str) -> bool:
+        # Loads a plain PCM wav file by memory-mapping it and taking the sample data straight out of
+        # the page cache, bypassing the wave module's chunked file reads.
+        # Returns False if the file is something else, so it can be loaded via the wave module instead.
+        try:
+            if not stat.S_ISREG(os.stat(filename).st_mode):
+                return False    # a pipe or device can't be memory-mapped
+        except OSError:
+            return False    # let the wave module report the error
+        with open(filename, "rb") as f:
+            try:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except (ValueError, OSError):
+                return False    # empty file, or a file that can't be memory-mapped
+        with mapped:
+            try:
+                layout = _wav_pcm_layout(mapped)
+            except struct.error:
+                layout = None   # truncated chunk
+            if layout is None:
+                return False
+            nchannels, samplerate, samplewidth, offset, length = layout
+            if not 2 <= samplewidth <= 4:
+                raise IOError("only supports sample sizes of 2, 3 or 4 bytes")
+            if not 1 <= nchannels <= 2:
+                raise IOError("only supports mono or stereo channels")
+            self.__nchannels = nchannels
+            self.__samplerate = samplerate
+            self.__samplewidth = samplewidth
+            self.__frames = mapped[offset:offset+length]
+        if sys.byteorder == "big":
+            self.__frames = audioop.byteswap(self.__frames, self.__samplewidth)
+        return True
+
     def write_wav(self, file_or_stream: Union[str, BinaryIO]) -> None:
         """Write a wav file with the current sample data. You can use a filename or a stream object."""
         with wave.open(file_or_stream, "wb") as out:
@@ -370,6 +520,9 @@ class Sample:
         """
         if self.__locked:
             raise RuntimeError("cannot modify a locked sample")
+        if self.__samplerate == params.norm_samplerate and self.__samplewidth == params.norm_samplewidth \
+                and self.__nchannels == params.norm_nchannels:
+            return self     # already normalized
         self.resample(params.norm_samplerate)
         if self.samplewidth != params.norm_samplewidth:
             # Convert to desired sample size.
@@ -379,8 +532,7 @@ class Sample:
             raise ValueError("norm_nchannels has invalid value, can only be 1 or 2")
         if self.nchannels == 1 and params.norm_nchannels == 2:
             # convert to stereo
-            self.__frames = audioop.tostereo(self.__frames, self.samplewidth, 1, 1)
-            self.__nchannels = 2
+            self.stereo()
         elif self.nchannels == 2 and params.norm_nchannels == 1:
             # convert to mono
             self.__frames = audioop.tomono(self.__frames, self.__samplewidth, 1, 1)
@@ -400,6 +552,14 @@ class Sample:
         self.__samplerate = samplerate
         return self
 
+    def ratecv_stream(self, chunk: bytes, samplerate: int, state: Optional[Tuple[Any, ...]] = None) -> Tuple[bytes, Tuple[Any, ...]]:
+        """
+        Resamples a single chunk of raw frame data (in this sample's format) to a different sample rate.
+        Returns a tuple (converted frames, state). Pass the state along with the next chunk to be able
+        to resample a large amount of frame data in pieces, without having to keep it all in memory at once.
+        """
+        return audioop.ratecv(chunk, self.__samplewidth, self.__nchannels, self.__samplerate, samplerate, state)
+
     def speed(self, speed: float) -> 'Sample':
         """
         Changes the playback speed of the sample, without changing the sample rate.
@@ -433,6 +593,13 @@ class Sample:
         """Returns the raw sample frames scaled to 32 bits. See make_32bit method for more info."""
         if self.samplewidth == 4:
             return self.__frames
+        if numpy and self.samplewidth != 3:
+            # widen (and possibly scale) the sample values in a single pass, without intermediate copies
+            datatype = samplewidths_to_numpytype[self.samplewidth]
+            values = numpy.frombuffer(self.__frames, dtype=datatype).astype(numpy.int32)
+            if scale_amplitude:
+                values <<= 8*(4-self.samplewidth)
+            return values.tobytes()
         frames = audioop.lin2lin(self.__frames, self.samplewidth, 4)   # type: bytes
         if not scale_amplitude:
             # we need to scale back the sample amplitude to fit back into 24/16/8 bit range
@@ -449,6 +616,16 @@ class Sample:
         if self.__locked:
             raise RuntimeError("cannot modify a locked sample")
         assert self.samplewidth >= 2
+        if maximize_amplitude and numpy and self.samplewidth == 4:
+            # amplify and narrow the sample values in a single pass. This gives the same result as
+            # amplify_max followed by lin2lin: dropping the low 16 bits is a division by 2**16, rounded down.
+            max_amp = _max(self.__frames, 4)
+            if max_amp > 0:
+                values = numpy.frombuffer(self.__frames, dtype=numpy.int32) * ((2**31-2)/max_amp/2**16)
+                numpy.floor(values, out=values)
+                self.__frames = values.astype(numpy.int16).tobytes()
+                self.__samplewidth = 2
+                return self
         if maximize_amplitude:
             self.amplify_max()
         if self.samplewidth > 2:
@@ -460,18 +637,21 @@ class Sample:
         """Amplify the sample to maximum volume without clipping or overflow happening."""
         if self.__locked:
             raise RuntimeError("cannot modify a locked sample")
-        max_amp = audioop.max(self.__frames, self.samplewidth)
+        max_amp = _max(self.__frames, self.samplewidth)
         max_target = 2 ** (8 * self.samplewidth - 1) - 2
         if max_amp > 0:
             factor = max_target/max_amp
-            self.__frames = audioop.mul(self.__frames, self.samplewidth, factor)
+            # the factor keeps every value within range, so there's nothing to clip
+            self.__frames = _mul(self.__frames, self.samplewidth, factor, clip=False)
         return self
 
     def amplify(self, factor: float) -> 'Sample':
         """Amplifies (multiplies) the sample by the given factor. May cause clipping/overflow if factor is too large."""
         if self.__locked:
             raise RuntimeError("cannot modify a locked sample")
-        self.__frames = audioop.mul(self.__frames, self.samplewidth, factor)
+        if factor == 1.0:
+            return self     # the sample values stay the same
+        self.__frames = _mul(self.__frames, self.samplewidth, factor)
         return self
 
     def at_volume(self, volume: float) -> 'Sample':
@@ -492,7 +672,7 @@ class Sample:
         assert end_seconds >= start_seconds
         start = self.frame_idx(start_seconds)
         end = self.frame_idx(end_seconds)
-        self.__frames = self.__frames[start:end]
+        self._keep_frames(start, end)
         return self
 
     def split(self, seconds: float) -> 'Sample':
@@ -501,9 +681,12 @@ class Sample:
             raise RuntimeError("cannot modify a locked sample")
         end = self.frame_idx(seconds)
         if end != len(self.__frames):
+            shared = self.__shared
             chopped = self.copy()
+            self.__shared = shared      # the copy gets its own frames, so nothing is shared after all
             chopped.__frames = self.__frames[end:]
-            self.__frames = self.__frames[:end]
+            chopped.__shared = False
+            self._keep_frames(0, end)
             return chopped
         return Sample.from_raw_frames(b"", self.__samplewidth, self.__samplerate, self.__nchannels)
 
@@ -513,9 +696,9 @@ class Sample:
             raise RuntimeError("cannot modify a locked sample")
         required_extra = self.frame_idx(seconds)
         if at_start:
-            self.__frames = b"\0"*required_extra + self.__frames
+            self.__frames = bytes(required_extra) + self.__frames
         else:
-            self.__frames += b"\0"*required_extra
+            self._mix_grow_if_needed(len(self.__frames), required_extra)
         return self
 
     def join(self, other: 'Sample') -> 'Sample':
@@ -525,14 +708,25 @@ class Sample:
         assert self.samplewidth == other.samplewidth
         assert self.samplerate == other.samplerate
         assert self.nchannels == other.nchannels
-        self.__frames += other.__frames
+        if self.__shared or not isinstance(self.__frames, bytearray):
+            # make it a bytearray of our own, so that (repeated) joins can grow it in place
+            frames = bytearray(self.__frames)
+            self.__shared = False
+        else:
+            frames = self.__frames
+        try:
+            frames += other.__frames
+        except BufferError:
+            # the buffer can't be resized while it is being viewed (memoryview), so make a new one
+            frames = frames + other.__frames
+        self.__frames = frames     # type: ignore  # (the sample data can be bytes or a bytearray)
         return self
 
     def fadeout(self, seconds: float, target_volume: float = 0.0) -> 'Sample':
         """Fade the end of the sample out to the target volume (usually zero) in the given time."""
         if self.__locked:
             raise RuntimeError("cannot modify a locked sample")
-        if not self.__frames:
+        if not self.__frames or seconds <= 0:
             return self
         seconds = min(seconds, self.duration)
         i = self.frame_idx(self.duration-seconds)
@@ -540,12 +734,15 @@ class Sample:
         end = self.__frames[i:]  # we fade this chunk
         numsamples = len(end)/self.__samplewidth
         decrease = 1.0-target_volume
-        _sw = self.__samplewidth     # optimization
-        _getsample = audioop.getsample   # optimization
-        faded = Sample.get_array(_sw, [int(_getsample(end, _sw, i)*(1.0-i*decrease/numsamples)) for i in range(int(numsamples))])
-        end = faded.tobytes()
-        if sys.byteorder == "big":
-            end = audioop.byteswap(end, self.__samplewidth)
+        if numpy:
+            end = _ramp(end, self.__samplewidth, 1.0-numpy.arange(int(numsamples))*decrease/numsamples)
+        else:
+            # (going through an array of the sample values is faster than calling audioop.getsample for each)
+            values = Sample.get_array(self.__samplewidth, end)
+            faded = Sample.get_array(self.__samplewidth, [int(v*(1.0-i*decrease/numsamples)) for i, v in enumerate(values)])
+            end = faded.tobytes()
+            if sys.byteorder == "big":
+                end = audioop.byteswap(end, self.__samplewidth)
         self.__frames = begin + end
         return self
 
@@ -553,7 +750,7 @@ class Sample:
         """Fade the start of the sample in from the starting volume (usually zero) in the given time."""
         if self.__locked:
             raise RuntimeError("cannot modify a locked sample")
-        if not self.__frames:
+        if not self.__frames or seconds <= 0:
             return self
         seconds = min(seconds, self.duration)
         i = self.frame_idx(seconds)
@@ -561,13 +758,15 @@ class Sample:
         end = self.__frames[i:]
         numsamples = len(begin)/self.__samplewidth
         increase = 1.0-start_volume
-        _sw = self.__samplewidth     # optimization
-        _getsample = audioop.getsample   # optimization
         _incr = increase/numsamples    # optimization
-        faded = Sample.get_array(_sw, [int(_getsample(begin, _sw, i)*(i*_incr+start_volume)) for i in range(int(numsamples))])
-        begin = faded.tobytes()
-        if sys.byteorder == "big":
-            begin = audioop.byteswap(begin, self.__samplewidth)
+        if numpy:
+            begin = _ramp(begin, self.__samplewidth, numpy.arange(int(numsamples))*_incr+start_volume)
+        else:
+            values = Sample.get_array(self.__samplewidth, begin)
+            faded = Sample.get_array(self.__samplewidth, [int(v*(i*_incr+start_volume)) for i, v in enumerate(values)])
+            begin = faded.tobytes()
+            if sys.byteorder == "big":
+                begin = audioop.byteswap(begin, self.__samplewidth)
         self.__frames = begin + end
         return self
 
@@ -580,17 +779,29 @@ class Sample:
         """
         if self.__locked:
             raise RuntimeError("cannot modify a locked sample")
-        frames = self.get_frame_array()
         if isinstance(modulation_source, (Sample, list, array.array)):
             # modulator is a waveform, turn that into an 'oscillator' ran
             if isinstance(modulation_source, Sample):
                 modulation_source = modulation_source.get_frame_array()
             biggest = max(max(modulation_source), abs(min(modulation_source)))
+            if numpy and biggest and self.__samplewidth in samplewidths_to_numpytype:
+                # cycle the scaled waveform to the length of the sample all at once, instead of value by value
+                numsamples = len(self.__frames) // self.__samplewidth
+                factors = numpy.resize(numpy.array(modulation_source, dtype=numpy.float64) / biggest, numsamples)
+                self.__frames = _ramp(self.__frames, self.__samplewidth, factors)
+                return self
             actual_modulator = (v/biggest for v in itertools.cycle(modulation_source))   # type: ignore
         elif isinstance(modulation_source, Oscillator):
             actual_modulator = itertools.chain.from_iterable(modulation_source.blocks())    # type: ignore
         else:
             actual_modulator = iter(modulation_source)  # type: ignore
+        if numpy and self.__samplewidth in samplewidths_to_numpytype:
+            # collect the modulation factors first, then apply them all at once
+            numsamples = len(self.__frames) // self.__samplewidth
+            factors = numpy.fromiter(itertools.islice(actual_modulator, numsamples), dtype=numpy.float64, count=numsamples)
+            self.__frames = _ramp(self.__frames, self.__samplewidth, factors)
+            return self
+        frames = self.get_frame_array()
         for i in range(len(frames)):
             frames[i] = int(frames[i] * next(actual_modulator))
         self.__frames = frames.tobytes()
@@ -686,7 +897,12 @@ class Sample:
             self.left().amplify(left_factor)
             return self.stereo_mix(right, 'R', right_factor)
         if self.__nchannels == 1:
-            self.__frames = audioop.tostereo(self.__frames, self.__samplewidth, left_factor, right_factor)
+            if left_factor == right_factor == 1.0 and numpy and self.__samplewidth != 3:
+                # both channels get the same unscaled values so simply duplicate every sample value
+                datatype = samplewidths_to_numpytype[self.__samplewidth]
+                self.__frames = numpy.repeat(numpy.frombuffer(self.__frames, dtype=datatype), 2).tobytes()
+            else:
+                self.__frames = audioop.tostereo(self.__frames, self.__samplewidth, left_factor, right_factor)
             self.__nchannels = 2
             return self
         raise ValueError("sample must be mono or stereo")
@@ -710,6 +926,26 @@ class Sample:
                 self.stereo(left_factor=0, right_factor=1)
             else:
                 self.stereo(left_factor=1, right_factor=0)
+        if numpy and self.__samplewidth != 3:
+            # mix the mono sample straight into the left or right channel, without making a stereo copy of it.
+            # This clips and rounds just like the tostereo conversion and the mix below.
+            datatype = samplewidths_to_numpytype[self.__samplewidth]
+            info = numpy.iinfo(datatype)
+            mono = numpy.frombuffer(other.__frames, dtype=datatype)
+            if other_seconds:
+                mono = mono[:other.frame_idx(other_seconds) // self.__samplewidth]
+            start_frame_idx = self.frame_idx(mix_at)
+            self._mix_grow_if_needed(start_frame_idx, 2 * len(mono) * self.__samplewidth)
+            mixed = mono * float(other_mix_factor)
+            numpy.floor(mixed, out=mixed)
+            numpy.clip(mixed, info.min, info.max, out=mixed)
+            first = start_frame_idx // self.__samplewidth + (other_channel == 'R')
+            channel = numpy.frombuffer(self.__frames, dtype=datatype)[first::2][:len(mono)]
+            mixed += channel
+            numpy.clip(mixed, info.min, info.max, out=mixed)
+            channel[:] = mixed
+            del channel     # release the buffer of the sample data
+            return self
         # turn other sample into stereo and mix it efficiently
         other = other.copy()
         if other_channel == 'L':
@@ -807,17 +1043,17 @@ class Sample:
         assert self.samplewidth == other.samplewidth
         assert self.samplerate == other.samplerate
         assert self.nchannels == other.nchannels
-        frames1 = self.__frames
+        frames2 = memoryview(other.__frames)    # slicing a memoryview doesn't copy the data
         if other_seconds:
-            frames2 = other.__frames[:other.frame_idx(other_seconds)]
-        else:
-            frames2 = other.__frames
+            frames2 = frames2[:other.frame_idx(other_seconds)]
         if pad_shortest:
-            if len(frames1) < len(frames2):
-                frames1 += b"\0"*(len(frames2)-len(frames1))
-            elif len(frames2) < len(frames1):
-                frames2 += b"\0"*(len(frames1)-len(frames2))
-        self.__frames = audioop.add(frames1, frames2, self.samplewidth)
+            # grow the current sample if it's too short, and mix the other sample into it in place
+            # (the other sample doesn't need padding: it's only added to the first part of the current sample)
+            self._mix_grow_if_needed(0, len(frames2))
+            with memoryview(self.__frames) as frames1:
+                frames1[:len(frames2)] = audioop.add(frames1[:len(frames2)], frames2, self.samplewidth)
+        else:
+            self.__frames = audioop.add(self.__frames, frames2, self.samplewidth)
         return self
 
     def mix_at(self, seconds: float, other: 'Sample', other_seconds: Optional[float] = None) -> 'Sample':
@@ -833,36 +1069,43 @@ class Sample:
         assert self.samplerate == other.samplerate
         assert self.nchannels == other.nchannels
         start_frame_idx = self.frame_idx(seconds)
+        other_frames = memoryview(other.__frames)   # slicing a memoryview doesn't copy the data
         if other_seconds:
-            other_frames = other.__frames[:other.frame_idx(other_seconds)]
-        else:
-            other_frames = other.__frames
-        # Mix the frames. Unfortunately audioop requires splitting and copying the sample data, which is slow.
-        pre, to_mix, post = self._mix_split_frames(len(other_frames), start_frame_idx)
-        self.__frames = b""  # allow for garbage collection
-        mixed = audioop.add(to_mix, other_frames, self.samplewidth)
-        del to_mix  # more garbage collection
-        self.__frames = self._mix_join_frames(pre, mixed, post)
+            other_frames = other_frames[:other.frame_idx(other_seconds)]
+        # Mix the frames in place. audioop works directly on the memoryviews, only its result is a new object.
+        self._mix_grow_if_needed(start_frame_idx, len(other_frames))
+        end_frame_idx = start_frame_idx + len(other_frames)
+        with memoryview(self.__frames) as frames:
+            frames[start_frame_idx:end_frame_idx] = audioop.add(frames[start_frame_idx:end_frame_idx], other_frames, self.samplewidth)
         return self
 
-    def _mix_join_frames(self, pre: bytes, mid: bytes, post: bytes) -> bytes:
-        # warning: slow due to copying (but only significant when not streaming)
-        return pre + mid + post
-
-    def _mix_split_frames(self, other_frames_length: int, start_frame_idx: int) -> Tuple[bytes, bytes, bytes]:
-        # warning: slow due to copying (but only significant when not streaming)
-        self._mix_grow_if_needed(start_frame_idx, other_frames_length)
-        pre = self.__frames[:start_frame_idx]
-        to_mix = self.__frames[start_frame_idx:start_frame_idx + other_frames_length]
-        post = self.__frames[start_frame_idx + other_frames_length:]
-        return pre, to_mix, post
+    def _keep_frames(self, start: int, end: int) -> None:
+        # keep only the given part of the sample data. A bytearray of our own is shrunk in place, instead of copied
+        if isinstance(self.__frames, bytearray) and not self.__shared and 0 <= start <= end:
+            try:
+                del self.__frames[end:]
+                del self.__frames[:start]
+                return
+            except BufferError:
+                pass    # the buffer can't be resized while it is being viewed (memoryview)
+        self.__frames = self.__frames[start:end]
 
     def _mix_grow_if_needed(self, start_frame_idx: int, other_length: int) -> None:
-        # warning: slow due to copying (but only significant when not streaming)
+        # make sure the sample data is a mutable buffer of our own, that is large enough to hold start_frame_idx+other_length bytes
+        if self.__shared or not isinstance(self.__frames, bytearray):
+            frames = bytearray(self.__frames)
+            self.__shared = False
+        else:
+            frames = self.__frames
         required_length = start_frame_idx + other_length
-        if required_length > len(self.__frames):
+        if required_length > len(frames):
             # we need to extend the current sample buffer to make room for the mixed sample at the end
-            self.__frames += b"\0" * (required_length - len(self.__frames))
+            try:
+                frames.extend(bytes(required_length - len(frames)))
+            except BufferError:
+                # the buffer can't be resized while it is being viewed (memoryview), so make a new one
+                frames = frames + bytes(required_length - len(frames))
+        self.__frames = frames     # type: ignore  # (the sample data can be bytes or a bytearray)
 
 
 # noinspection PyAttributeOutsideInit
@@ -0,0 +1,30 @@
+import os
+import sys
+import pytest
+from synthplayer.sample import Sample
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "examples"))
+import trackmixer  # noqa: E402
+
+
+def instrument(seed, length):
+    values = [(i * seed * 7919) % 20001 - 10000 for i in range(length)]
+    return Sample.from_array(values, 44100, 1).stereo().make_32bit(scale_amplitude=False).lock()
+
+
+@pytest.mark.skipif(trackmixer.numpy is None, reason="numpy is not installed")
+@pytest.mark.parametrize("bpm, ticks", [(140, 8), (133, 4), (97, 3)])   # ticks that don't start on a whole frame
+def test_mix_paths_identical(bpm, ticks, monkeypatch):
+    instruments = {"kick": instrument(3, 9000), "snare": instrument(5, 2500), "hat": instrument(11, 400)}
+    patterns = [
+        {"kick": "x..x" * ticks, "hat": "xxx." * ticks},
+        {"kick": "x..." * ticks, "snare": "..x." * ticks, "hat": "x.x." * ticks},
+    ]
+    mixer = trackmixer.Mixer(patterns, bpm, ticks, instruments)
+    mixed = bytes(mixer.mix(False).view_frame_data())
+    streamed = b"".join(bytes(chunk.view_frame_data()) for chunk in mixer.mix_generator())
+    monkeypatch.setattr(trackmixer, "numpy", None)
+    mixed_without_numpy = bytes(mixer.mix(False).view_frame_data())
+    assert len(mixed) == 4 * 2 * mixer.tick_frame(mixer.total_ticks, 44100)
+    assert mixed == mixed_without_numpy
+    assert mixed == streamed